@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Optional
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
     """Global settings configuration using environment variables"""
@@ -57,6 +57,40 @@ class Settings(BaseSettings):
         description="Dialect of the schema"
     )
     
+    COLUMNAR_FORMAT: Optional[Literal["parquet", "arrow"]] = Field(
+        default=None,
+        description="Optional columnar export written alongside the database for Query Engine ingestion"
+    )
+    
+    ARTIFACT_FORMAT: Literal["pgp", "zstd"] = Field(
+        default="pgp",
+        description="Encrypted artifact format: 'pgp' (OpenPGP ZLIB compression) or 'zstd' (compact and zstd-compress before encryption)"
+    )
+    
+    ZSTD_LEVEL: int = Field(
+        default=10,
+        ge=1,
+        le=22,
+        description="zstd compression level used by the 'zstd' artifact format"
+    )
+    
+    PIPELINE_QUEUE_SIZE: int = Field(
+        default=2,
+        ge=1,
+        description="Capacity of the bounded queues between the read, parse, transform and write stages"
+    )
+    
+    MEMORY_BUDGET_MB: Optional[int] = Field(
+        default=None,
+        gt=0,
+        description="Memory ceiling in MB; chunk and batch sizes adapt to stay under it and inputs too large to encrypt within it fail before they are refined (unset means unbounded)"
+    )
+    
+    VALIDATED_INGESTION: bool = Field(
+        default=False,
+        description="Parse and strictly validate input files against the BrowsingInputDict schema in one pass with pydantic, instead of json.loads"
+    )
+    
     
     class Config:
         env_file = ".env"
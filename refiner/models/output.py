@@ -1,11 +1,11 @@
-from typing import Optional, List
+from typing import Any, Optional, List, Dict, Union
 from pydantic import BaseModel
 
 from refiner.models.offchain_schema import OffChainSchema
 
 class BrowsingEntryOutput(BaseModel):
     url: str
-    timeSpent: int
+    timeSpent: Union[int, float]
     timestamp: int
 
 class BrowsingStatsOutput(BaseModel):
@@ -19,5 +19,9 @@ class BrowsingOutput(BaseModel):
 
 class Output(BaseModel):
     refinement_url: Optional[str] = None
+    columnar_refinement_urls: Optional[Dict[str, str]] = None
     schema: Optional[OffChainSchema] = None
     browsing_data: Optional[BrowsingOutput] = None
+    quarantined_entries: Optional[int] = None
+    pipeline_metrics: Optional[List[Dict[str, Any]]] = None
+    peak_rss_bytes: Optional[int] = None
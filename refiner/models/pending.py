@@ -0,0 +1,195 @@
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from refiner.models.refined import BrowsingEntry
+from refiner.utils.date import parse_timestamp
+
+# Rows per executemany and commit when writing pending rows to the database
+WRITE_BATCH_SIZE = 10000
+
+# Timestamps are buffered as wall-clock microseconds since this epoch. DateTime
+# columns on SQLite store the naive wall-clock fields, so this round-trips exactly.
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(timestamp: datetime) -> int:
+    """Return the wall-clock fields of a datetime as microseconds since EPOCH."""
+    return (timestamp.replace(tzinfo=None) - EPOCH) // MICROSECOND
+
+
+def from_micros(micros: int) -> datetime:
+    """Inverse of to_micros, returning a naive datetime."""
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class DictionaryColumn(NamedTuple):
+    """A dictionary-encoded column: per-row indices into a list of distinct values."""
+    indices: array
+    values: List[Any]
+
+
+class TimestampColumn(NamedTuple):
+    """A timestamp column stored as wall-clock microseconds since EPOCH."""
+    micros: array
+
+
+class ValueDictionary:
+    """
+    Append-only dictionary of distinct values, shared by the consecutive
+    PendingRows chunks of one input so each value is stored once.
+    """
+    __slots__ = ('values', 'counts', '_index')
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self.counts: List[int] = []
+        self._index: Dict[Any, int] = {}
+
+    def add(self, value: Any) -> int:
+        """Count an occurrence of a value and return its id."""
+        value_id = self._index.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self._index[value] = value_id
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+            self.counts.append(0)
+        self.counts[value_id] += 1
+        return value_id
+
+
+class PendingRows:
+    """
+    Base class for compact buffers of rows awaiting insertion.
+
+    Transformers may yield these alongside SQLAlchemy model instances; the
+    writer inserts them in batches instead of adding one ORM object per row,
+    committing after each batch so an interrupted write can resume. A large
+    input is yielded as several consecutive buffers (chunks) for the same
+    table, each written as soon as it is complete.
+    """
+    __slots__ = ()
+
+    table = None
+
+    def __len__(self) -> int:
+        raise NotImplementedError("Subclasses must implement __len__")
+
+    def prepare(self, first_row: int) -> None:
+        """
+        Called once before the rows are written or exported.
+
+        Args:
+            first_row: Number of rows of the same table preceding this buffer in the
+                write, including those committed by an earlier, interrupted run
+        """
+
+    def write_batch(self, session, start: int, end: int) -> None:
+        """Insert rows [start, end) using the given session."""
+        raise NotImplementedError("Subclasses must implement write_batch method")
+
+    def columns(self) -> Dict[str, Any]:
+        """Return the rows of this buffer column by column for columnar export."""
+        raise NotImplementedError("Subclasses must implement columns method")
+
+
+class PendingBrowsingEntries(PendingRows):
+    """
+    Column-oriented buffer of browsing entries for a single author.
+
+    Each distinct URL is stored once in a ValueDictionary shared with the
+    other chunks of the same input, and rows refer to it by integer id.
+    Timestamps are parsed once on append and kept as int64 microseconds.
+    Time spent is kept exactly as given: in an int64 array while every value
+    is an integer, in a list once a float is seen.
+
+    float_time_spent selects float64 instead of int64 for time spent in the
+    columnar export. It must be the same for every chunk of an input, so the
+    transformer sets it when any entry of the input has a fractional value.
+    """
+    __slots__ = ('author_id', 'urls', 'url_ids', 'time_spent', 'timestamps', 'first_entry_id', 'float_time_spent')
+
+    table = BrowsingEntry.__table__
+
+    def __init__(self, author_id: str, urls: Optional[ValueDictionary] = None, float_time_spent: bool = False):
+        self.author_id = sys.intern(author_id) if isinstance(author_id, str) else author_id
+        self.urls = urls if urls is not None else ValueDictionary()
+        self.url_ids = array('I')
+        self.time_spent: Union[array, List[Union[int, float]]] = array('q')
+        self.timestamps = array('q')
+        self.first_entry_id = None
+        self.float_time_spent = float_time_spent
+
+    def __len__(self) -> int:
+        return len(self.url_ids)
+
+    def append(self, url: str, time_spent: Union[int, float], timestamp: Any) -> None:
+        """
+        Buffer a browsing entry.
+
+        Args:
+            url: The visited URL
+            time_spent: Time spent on the page
+            timestamp: Raw timestamp (epoch milliseconds or ISO string)
+
+        Raises:
+            TypeError, ValueError, OverflowError: If the entry is malformed; nothing is buffered
+        """
+        if not isinstance(url, str):
+            raise TypeError(f"url must be a string, got {type(url).__name__}")
+        if not isinstance(time_spent, (int, float)):
+            raise TypeError(f"timeSpent must be a number, got {type(time_spent).__name__}")
+        # Parse now so malformed timestamps are rejected before any row is written
+        micros = to_micros(parse_timestamp(timestamp))
+        if isinstance(time_spent, int) and not -2**63 <= time_spent < 2**63:
+            raise OverflowError("timeSpent does not fit in a 64-bit integer")
+        if isinstance(time_spent, float) and isinstance(self.time_spent, array):
+            self.time_spent = list(self.time_spent)
+
+        self.url_ids.append(self.urls.add(url))
+        self.time_spent.append(time_spent)
+        self.timestamps.append(micros)
+
+    def prepare(self, first_row: int) -> None:
+        """
+        Assign contiguous entry ids following those of the preceding chunks. The
+        database is recreated for every write, so ids simply number its rows from 1.
+        """
+        self.first_entry_id = first_row + 1
+
+    def write_batch(self, session, start: int, end: int) -> None:
+        """Insert entries [start, end) with explicit entry ids."""
+        session.execute(self.table.insert(), [
+            {
+                "entry_id": self.first_entry_id + i,
+                "author_id": self.author_id,
+                "url": self.urls.values[url_id],
+                "time_spent": time_spent,
+                "timestamp": from_micros(timestamp),
+            }
+            for i, url_id, time_spent, timestamp in zip(
+                range(start, end), self.url_ids[start:end], self.time_spent[start:end], self.timestamps[start:end]
+            )
+        ])
+
+    def columns(self) -> Dict[str, Any]:
+        """
+        Return the entries of this chunk column by column, with URL and author
+        dictionary-encoded and time spent as int64 unless float_time_spent is set.
+        """
+        if self.float_time_spent:
+            time_spent = array('d', self.time_spent)
+        elif isinstance(self.time_spent, array):
+            time_spent = self.time_spent
+        else:
+            # Floats without a fractional part, e.g. 5.0
+            time_spent = array('q', map(int, self.time_spent))
+        return {
+            "entry_id": array('q', range(self.first_entry_id, self.first_entry_id + len(self))),
+            "author_id": DictionaryColumn(array('I', [0]) * len(self), [self.author_id]),
+            "url": DictionaryColumn(self.url_ids, self.urls.values),
+            "time_spent": time_spent,
+            "timestamp": TimestampColumn(self.timestamps),
+        }
@@ -1,5 +1,6 @@
-from typing import Optional, List
+from typing import Optional, List, Union
 from pydantic import BaseModel
+from typing_extensions import TypedDict
 
 
 class Profile(BaseModel):
@@ -28,6 +29,23 @@ class BrowsingData(BaseModel):
     timeSpent: int
     timestamp: int
 
+# TypedDict mirrors of BrowsingData and its enclosing file for the validated ingestion path:
+# pydantic validates them straight from JSON into plain dicts. A TypeAdapter over BrowsingData
+# itself builds a model instance per entry, which made parse+transform about 1.6x slower.
+# Keep BrowsingDataDict in sync with BrowsingData by hand (fields, types and which are required).
+class BrowsingDataDict(TypedDict):
+    url: str
+    timeSpent: int
+    timestamp: int
+
+class BrowsingDataContentDict(TypedDict, total=False):
+    browsingDataArray: List[BrowsingDataDict]
+
+class BrowsingInputDict(TypedDict, total=False):
+    data: BrowsingDataContentDict
+    created_time: Union[int, str]
+    author: str
+
 class EvaluationMetrics(BaseModel):
     url_count: int
     timeSpent: List[int]
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import os
@@ -6,105 +7,344 @@ from refiner.models.offchain_schema import OffChainSchema
 from refiner.models.output import Output, BrowsingOutput, BrowsingStatsOutput, BrowsingEntryOutput
 from refiner.transformer.browsing_transformer import BrowsingTransformer
 from refiner.config import settings
+from refiner.utils.checkpoint import Checkpoint
 from refiner.utils.encrypt import encrypt_file
 from refiner.utils.ipfs import upload_file_to_ipfs, upload_json_to_ipfs
+from refiner.utils.memory import MemoryBudget, MemoryBudgetExceeded, peak_rss
+from refiner.utils.pipeline import Pipeline
+from refiner.utils.validation import validate_browsing_json
+
+# Emitted by the transform stage after the last model of an input file
+_END_OF_FILE = object()
+
+# Settings that shape the refined artifacts. They are part of each input's checkpoint
+# key, so changing one of them refines the input again instead of reusing old artifacts.
+ARTIFACT_SETTINGS = (
+    'COLUMNAR_FORMAT', 'ARTIFACT_FORMAT', 'ZSTD_LEVEL', 'VALIDATED_INGESTION', 'REFINEMENT_ENCRYPTION_KEY',
+    'SCHEMA_NAME', 'SCHEMA_VERSION', 'SCHEMA_DESCRIPTION', 'SCHEMA_DIALECT', 'IPFS_API_URL',
+)
 
 class Refiner:
     def __init__(self):
         self.db_path = os.path.join(settings.OUTPUT_DIR, 'db.libsql')
+        self.quarantine_dir = os.path.join(settings.OUTPUT_DIR, 'quarantine')
+        self.checkpoint = Checkpoint(os.path.join(settings.OUTPUT_DIR, 'checkpoint.json'))
+        self.memory_budget = MemoryBudget(settings.MEMORY_BUDGET_MB)
+        # Hashed so the encryption key is never written to the checkpoint
+        self.settings_digest = hashlib.sha256(json.dumps(
+            {name: getattr(settings, name) for name in ARTIFACT_SETTINGS}, sort_keys=True
+        ).encode()).hexdigest()
 
     def transform(self) -> Output:
         """Transform all input files into the database."""
         logging.info("Starting data transformation")
         output = Output()
 
-        # Iterate through files and transform data
-        input_files = os.listdir(settings.INPUT_DIR)
+        # Iterate through files and transform data. Reading, parsing and transforming run
+        # in their own pipeline stages while this thread writes and publishes each file.
+        # Models are streamed in chunks, so a file is written while it is still transformed.
+        # Sorted so re-runs process inputs in the same order
+        input_files = sorted(os.listdir(settings.INPUT_DIR))
         logging.info(f"Discovered input files: {input_files}")
-        for input_filename in input_files:
-            input_file = os.path.join(settings.INPUT_DIR, input_filename)
-            ext = os.path.splitext(input_file)[1].lower()
-            logging.info(f"Processing file: {input_filename} (full path: {input_file}, extension: {ext})")
-            if ext in ['.json', '.zip']:
+        pipeline = Pipeline(
+            input_files,
+            [
+                ("read", self._read),
+                ("parse", self._parse),
+                ("transform", self._transform),
+            ],
+            queue_size=self.memory_budget.queue_size(settings.PIPELINE_QUEUE_SIZE),
+            # Within a budget, the next input is not read until the current one is transformed
+            max_in_flight=self.memory_budget.inputs_in_flight(),
+            sink_name="write",
+        )
+        for data_filename, digest, transformer, models in self._group_by_file(pipeline):
+            self.checkpoint.begin(data_filename, digest)
+            published = self.checkpoint.get("published")
+            if published is not None:
+                self._restore_published(output, data_filename, published)
+                continue
+            
+            written = self.checkpoint.get("written")
+            if written is not None and self.checkpoint.holds_database() and os.path.exists(self.db_path):
+                logging.info(f"{data_filename} was already written to {self.db_path}, skipping write")
+                for _ in models:
+                    pass
+                transformer.open_database()
+                transformer.columnar_paths = written["columnar_paths"]
+            else:
+                logging.info(f"Writing transformed data for {data_filename}")
+                self.checkpoint.claim_database()
+                # Resumes after the last committed batch if an earlier run was interrupted
+                transformer.write(models, resume_key=digest)
+                self._write_quarantine(data_filename, transformer.quarantined)
+                written = {"columnar_paths": transformer.columnar_paths, "quarantined": len(transformer.quarantined)}
+                self.checkpoint.complete("written", written)
+            output.quarantined_entries = (output.quarantined_entries or 0) + written["quarantined"]
+            logging.info(f"Transformed {data_filename}")
+            
+            # Create a schema based on the SQLAlchemy schema
+            logging.info(f"Creating OffChainSchema for {data_filename}")
+            schema = OffChainSchema(
+                name=settings.SCHEMA_NAME,
+                version=settings.SCHEMA_VERSION,
+                description=settings.SCHEMA_DESCRIPTION,
+                dialect=settings.SCHEMA_DIALECT,
+                schema=transformer.get_schema()
+            )
+            output.schema = schema
+            logging.info(f"Schema created: {schema.model_dump()}")
+            
+            # Generate output data for browsing
+            self._set_browsing_output(output, data_filename, transformer)
+            
+            # Recorded once every upload succeeded, so a re-run can skip this input entirely
+            published = {
+                "quarantined": written["quarantined"],
+                "schema": schema.model_dump(),
+                "refinement_hash": None,
+                "columnar_hashes": {},
+            }
+            failed = False
+            
+            # Upload the schema to IPFS
+            try:
+                schema_ipfs_hash = self.checkpoint.get("schema_ipfs_hash")
+                if schema_ipfs_hash is None:
+                    schema_ipfs_hash = upload_json_to_ipfs(schema.model_dump())
+                    self.checkpoint.complete("schema_ipfs_hash", schema_ipfs_hash)
+                logging.info(f"Schema uploaded to IPFS with hash: {schema_ipfs_hash}")
+            except Exception as e:
+                failed = True
+                logging.error(f"Failed to upload schema for {data_filename}: {e}")
+            
+            # Encrypt and upload the database to IPFS
+            try:
+                ipfs_hash = self._encrypt_and_upload(self.db_path, compact=transformer.compact)
+                output.refinement_url = f"{settings.IPFS_HTTPS_URL}/ipfs/{ipfs_hash}"
+                published["refinement_hash"] = ipfs_hash
+                logging.info(f"Encrypted DB uploaded to IPFS with hash: {ipfs_hash}")
+            except Exception as e:
+                failed = True
+                logging.error(f"Failed to encrypt/upload database for {data_filename}: {e}")
+            
+            # Encrypt and upload the columnar export (if any) with the same key
+            for columnar_path in transformer.columnar_paths:
                 try:
-                    with open(input_file, 'r') as f:
-                        raw_content = f.read()
-                        logging.info(f"Raw content of {input_file}:\n{raw_content}")
-                        f.seek(0)
-                        input_data = json.loads(raw_content)
-                        input_data_list = [(input_filename, input_data)]
+                    ipfs_hash = self._encrypt_and_upload(columnar_path)
+                    if output.columnar_refinement_urls is None:
+                        output.columnar_refinement_urls = {}
+                    output.columnar_refinement_urls[os.path.basename(columnar_path)] = f"{settings.IPFS_HTTPS_URL}/ipfs/{ipfs_hash}"
+                    published["columnar_hashes"][os.path.basename(columnar_path)] = ipfs_hash
+                    logging.info(f"Encrypted {columnar_path} uploaded to IPFS with hash: {ipfs_hash}")
                 except Exception as e:
-                    logging.error(f"Failed to load {input_file}: {e}")
-                    input_data_list = []
-                    continue
+                    failed = True
+                    logging.error(f"Failed to encrypt/upload {columnar_path} for {data_filename}: {e}")
             
-                for data_filename, input_data in input_data_list:
-                    # Transform browsing data
-                    logging.info(f"Instantiating BrowsingTransformer for {data_filename}")
-                    transformer = BrowsingTransformer(self.db_path)
-                    logging.info(f"Processing input data with BrowsingTransformer for {data_filename}")
-                    transformer.process(input_data)
-                    logging.info(f"Transformed {data_filename}")
-                    
-                    # Create a schema based on the SQLAlchemy schema
-                    logging.info(f"Creating OffChainSchema for {data_filename}")
-                    schema = OffChainSchema(
-                        name=settings.SCHEMA_NAME,
-                        version=settings.SCHEMA_VERSION,
-                        description=settings.SCHEMA_DESCRIPTION,
-                        dialect=settings.SCHEMA_DIALECT,
-                        schema=transformer.get_schema()
-                    )
-                    output.schema = schema
-                    logging.info(f"Schema created: {schema.model_dump()}")
-                    
-                    # Generate output data for browsing
-                    browsing_data = transformer.get_output_data()
-                    if browsing_data:
-                        logging.info(f"Browsing data found for {data_filename}: {browsing_data}")
-                        stats = BrowsingStatsOutput(
-                            urls=browsing_data["stats"]["urls"],
-                            averageTimeSpent=browsing_data["stats"]["averageTimeSpent"],
-                            type=browsing_data["stats"]["type"]
-                        )
-                        
-                        entries = [
-                            BrowsingEntryOutput(
-                                url=entry["url"],
-                                timeSpent=entry["timeSpent"],
-                                timestamp=entry["timestamp"]
-                            )
-                            for entry in browsing_data["data"]
-                        ]
-                        
-                        output.browsing_data = BrowsingOutput(
-                            stats=stats,
-                            data=entries
-                        )
-                        logging.info(f"Browsing output generated for {data_filename}")
-                    else:
-                        logging.info(f"No browsing data found for {data_filename}")
-                    
-                    # Upload the schema to IPFS
-                    try:
-                        schema_ipfs_hash = upload_json_to_ipfs(schema.model_dump())
-                        logging.info(f"Schema uploaded to IPFS with hash: {schema_ipfs_hash}")
-                    except Exception as e:
-                        logging.error(f"Failed to upload schema for {data_filename}: {e}")
-                    
-                    # Encrypt and upload the database to IPFS
-                    try:
-                        logging.info(f"Encrypting database at {self.db_path}")
-                        encrypted_path = encrypt_file(settings.REFINEMENT_ENCRYPTION_KEY, self.db_path)
-                        logging.info(f"Encrypted database written to {encrypted_path}")
-                        ipfs_hash = upload_file_to_ipfs(encrypted_path)
-                        output.refinement_url = f"{settings.IPFS_HTTPS_URL}/ipfs/{ipfs_hash}"
-                        logging.info(f"Encrypted DB uploaded to IPFS with hash: {ipfs_hash}")
-                    except Exception as e:
-                        logging.error(f"Failed to encrypt/upload database for {data_filename}: {e}")
-                continue
-            else:
-                logging.info(f"Skipping unsupported file type: {input_filename}")
+            if not failed:
+                self.checkpoint.complete("published", published)
 
+        pipeline.log_metrics()
+        output.pipeline_metrics = pipeline.get_metrics()
+        output.peak_rss_bytes = peak_rss()
+        logging.info(f"Peak RSS: {output.peak_rss_bytes} bytes")
         logging.info("Data transformation completed successfully")
         return output
+
+    def _set_browsing_output(self, output: Output, data_filename: str, transformer) -> None:
+        """Set the browsing data of output.json from a written database."""
+        browsing_data = transformer.get_output_data()
+        if browsing_data:
+            logging.info(f"Browsing data found for {data_filename}: {browsing_data}")
+            stats = BrowsingStatsOutput(
+                urls=browsing_data["stats"]["urls"],
+                averageTimeSpent=browsing_data["stats"]["averageTimeSpent"],
+                type=browsing_data["stats"]["type"]
+            )
+            
+            entries = [
+                BrowsingEntryOutput(
+                    url=entry["url"],
+                    timeSpent=entry["timeSpent"],
+                    timestamp=entry["timestamp"]
+                )
+                for entry in browsing_data["data"]
+            ]
+            
+            output.browsing_data = BrowsingOutput(
+                stats=stats,
+                data=entries
+            )
+            logging.info(f"Browsing output generated for {data_filename}")
+        else:
+            logging.info(f"No browsing data found for {data_filename}")
+
+    def _restore_published(self, output: Output, data_filename: str, published: dict) -> None:
+        """Add the results of an input published by an earlier run to the output."""
+        logging.info(f"{data_filename} was already refined and published with the same settings, skipping")
+        output.quarantined_entries = (output.quarantined_entries or 0) + published["quarantined"]
+        output.schema = OffChainSchema(**published["schema"])
+        output.refinement_url = f"{settings.IPFS_HTTPS_URL}/ipfs/{published['refinement_hash']}"
+        for name, ipfs_hash in published["columnar_hashes"].items():
+            if output.columnar_refinement_urls is None:
+                output.columnar_refinement_urls = {}
+            output.columnar_refinement_urls[name] = f"{settings.IPFS_HTTPS_URL}/ipfs/{ipfs_hash}"
+        
+        if self.checkpoint.holds_database() and os.path.exists(self.db_path):
+            transformer = BrowsingTransformer(self.db_path, defer_initialization=True)
+            transformer.open_database()
+            try:
+                self._set_browsing_output(output, data_filename, transformer)
+            finally:
+                transformer.engine.dispose()
+        else:
+            # Only the input written last keeps its database in the output directory
+            logging.warning(f"The database of {data_filename} was replaced by another input, "
+                            f"its browsing data is not included in the output")
+
+    @staticmethod
+    def _group_by_file(items):
+        """
+        Group the (filename, digest, transformer, model) items streamed by the
+        transform stage into one (filename, digest, transformer, models) per
+        input file, where models pulls that file's items as they arrive.
+        """
+        items = iter(items)
+        for data_filename, digest, transformer, model in items:
+            def models(model=model):
+                while model is not _END_OF_FILE:
+                    yield model
+                    model = next(items)[3]
+            file_models = models()
+            yield data_filename, digest, transformer, file_models
+            # Skip whatever the consumer left of this file
+            for _ in file_models:
+                pass
+
+    def _read(self, input_filename: str):
+        """
+        Pipeline stage: read a supported input file.
+        
+        Raises:
+            MemoryBudgetExceeded: If encrypting the artifacts refined from the file would
+                not fit in MEMORY_BUDGET_MB
+        """
+        input_file = os.path.join(settings.INPUT_DIR, input_filename)
+        ext = os.path.splitext(input_file)[1].lower()
+        logging.info(f"Processing file: {input_filename} (full path: {input_file}, extension: {ext})")
+        if ext not in ['.json', '.zip']:
+            logging.info(f"Skipping unsupported file type: {input_filename}")
+            return None
+        try:
+            with open(input_file, 'rb') as f:
+                raw_content = f.read()
+        except Exception as e:
+            logging.error(f"Failed to load {input_file}: {e}")
+            return None
+        logging.info(f"Raw content of {input_file}:\n{raw_content.decode(errors='replace')}")
+        # Identifies the input in the checkpoint and resumable writes
+        digest = hashlib.sha256(f"{self.settings_digest}\0{input_filename}\0".encode() + raw_content).hexdigest()
+        if self.checkpoint.get("published", digest) is not None:
+            # Nothing to parse or transform; the sink restores its published results
+            return input_filename, digest, None
+        if not self.memory_budget.fits_encryption(len(raw_content), settings.ARTIFACT_FORMAT):
+            # Encryption is not streamed, so fail before the input is refined rather than after
+            required = self.memory_budget.encryption_bytes(len(raw_content), settings.ARTIFACT_FORMAT)
+            hint = "set ARTIFACT_FORMAT=zstd or raise the budget" if settings.ARTIFACT_FORMAT == 'pgp' else "raise the budget"
+            raise MemoryBudgetExceeded(
+                f"Encrypting the artifacts of {input_filename} ({len(raw_content)} bytes) needs about {required} bytes, "
+                f"more than MEMORY_BUDGET_MB={settings.MEMORY_BUDGET_MB}; {hint}"
+            )
+        return input_filename, digest, raw_content
+
+    def _parse(self, item):
+        """
+        Pipeline stage: parse the raw JSON content of an input file, validating it
+        against the BrowsingInputDict schema in the same pass if VALIDATED_INGESTION is set.
+        """
+        input_filename, digest, raw_content = item
+        if raw_content is None:
+            return input_filename, digest, None, []
+        try:
+            if settings.VALIDATED_INGESTION:
+                input_data, rejected = validate_browsing_json(raw_content)
+                return input_filename, digest, input_data, rejected
+            return input_filename, digest, json.loads(raw_content), []
+        except Exception as e:
+            logging.error(f"Failed to load {os.path.join(settings.INPUT_DIR, input_filename)}: {e}")
+            return None
+
+    def _transform(self, item):
+        """
+        Pipeline stage: transform parsed data into models without touching the database,
+        passing each model (or chunk of entries) on as soon as it is produced.
+        """
+        data_filename, digest, input_data, rejected = item
+        if input_data is None:
+            # Already published
+            yield data_filename, digest, None, _END_OF_FILE
+            return
+        logging.info(f"Instantiating BrowsingTransformer for {data_filename}")
+        transformer = BrowsingTransformer(
+            self.db_path,
+            columnar_format=settings.COLUMNAR_FORMAT,
+            # The database is still being written/encrypted for the previous file
+            defer_initialization=True,
+            memory_budget=self.memory_budget
+        )
+        for index, record, error in rejected:
+            transformer.quarantine(record, error, index=index)
+        logging.info(f"Processing input data with BrowsingTransformer for {data_filename}")
+        try:
+            models = transformer.transform(input_data, removed_indices=[index for index, _, _ in rejected])
+        except Exception as e:
+            # Malformed as a whole (e.g. not an object, or an invalid created_time): skip it like unparseable JSON
+            logging.error(f"Failed to transform {os.path.join(settings.INPUT_DIR, data_filename)}: {e}")
+            return
+        for model in models:
+            yield data_filename, digest, transformer, model
+        yield data_filename, digest, transformer, _END_OF_FILE
+
+    def _encrypt_and_upload(self, file_path: str, compact=None) -> str:
+        """
+        Encrypt a refined artifact and upload it to IPFS, skipping whichever of the
+        two already completed for the current input according to the checkpoint.
+        
+        Args:
+            file_path: Artifact to publish
+            compact: Optional callable run before encrypting (zstd artifact format only)
+        
+        Returns:
+            IPFS hash of the encrypted artifact
+        """
+        name = os.path.basename(file_path)
+        ipfs_hash = self.checkpoint.get(f"uploaded:{name}")
+        if ipfs_hash is not None:
+            return ipfs_hash
+        
+        encrypted_path = self.checkpoint.get(f"encrypted:{name}")
+        if encrypted_path is None or not os.path.exists(encrypted_path):
+            artifact_format = settings.ARTIFACT_FORMAT
+            if compact is not None and artifact_format == 'zstd':
+                compact()
+            logging.info(f"Encrypting {file_path} ({artifact_format} artifact format)")
+            encrypted_path = encrypt_file(settings.REFINEMENT_ENCRYPTION_KEY, file_path, artifact_format=artifact_format)
+            self.checkpoint.complete(f"encrypted:{name}", encrypted_path)
+            logging.info(f"Encrypted {file_path} written to {encrypted_path}")
+        
+        ipfs_hash = upload_file_to_ipfs(encrypted_path)
+        self.checkpoint.complete(f"uploaded:{name}", ipfs_hash)
+        return ipfs_hash
+
+    def _write_quarantine(self, data_filename: str, quarantined: list) -> None:
+        """Write entries rejected while transforming an input file as JSON lines."""
+        quarantine_path = os.path.join(self.quarantine_dir, f"{data_filename}.jsonl")
+        if not quarantined:
+            if os.path.exists(quarantine_path):
+                os.remove(quarantine_path)
+            return
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        with open(quarantine_path, 'w') as f:
+            for record in quarantined:
+                f.write(json.dumps(record, default=str) + "\n")
+        logging.warning(f"Quarantined {len(quarantined)} entries of {data_filename} to {quarantine_path}")
@@ -1,36 +1,114 @@
-from typing import Dict, Any, List
-from sqlalchemy import create_engine
+from typing import Dict, Any, Iterable, List, Optional, Tuple, Union
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from refiner.models.refined import Base
+from refiner.models.pending import PendingRows, WRITE_BATCH_SIZE
+from refiner.utils.columnar import ColumnarWriter
+from refiner.utils.memory import MemoryBudget
 import sqlite3
 import os
 import logging
 
+# Records how many rows of an unfinished write are committed; dropped once the write completes
+PROGRESS_TABLE = '_refinement_progress'
+
 class DataTransformer:
     """
     Base class for transforming JSON data into SQLAlchemy models.
     Users should extend this class and override the transform method
     to customize the transformation process for their specific data.
     """
+
+    # Tables included in the optional columnar export (empty means all tables)
+    columnar_tables: Tuple[str, ...] = ()
     
-    def __init__(self, db_path: str):
-        """Initialize the transformer with a database path."""
+    def __init__(self, db_path: str, columnar_format: Optional[str] = None, defer_initialization: bool = False,
+                 memory_budget: Optional[MemoryBudget] = None):
+        """
+        Initialize the transformer with a database path.
+        
+        Args:
+            db_path: Path of the SQLite database to write
+            columnar_format: Optional columnar format ('parquet' or 'arrow') written
+                next to the database from the same transformed models
+            defer_initialization: Leave the database untouched until the first write,
+                so transform can run while another transformer still owns the file
+            memory_budget: Optional memory ceiling used to size buffers and batches
+        """
         self.db_path = db_path
-        self._initialize_database()
+        self.columnar_format = columnar_format
+        self.memory_budget = memory_budget or MemoryBudget()
+        self.columnar_paths: List[str] = []
+        self.quarantined: List[Dict[str, Any]] = []
+        self.Session = None
+        if not defer_initialization:
+            self._initialize_database()
     
-    def _initialize_database(self) -> None:
+    def _initialize_database(self, resume_key: Optional[str] = None) -> int:
         """
         Initialize or recreate the database and its tables.
+        
+        Args:
+            resume_key: Identifies the input being written. An existing database
+                holding an unfinished write for the same key is kept.
+        
+        Returns:
+            Number of rows already committed for resume_key
         """
+        committed = self._read_progress(resume_key) if resume_key else 0
+        if committed:
+            logging.info(f"Resuming write into {self.db_path} after {committed} committed rows")
+            self.open_database()
+            return committed
+        
         if os.path.exists(self.db_path):
             os.remove(self.db_path)
             logging.info(f"Deleted existing database at {self.db_path}")
         
-        self.engine = create_engine(f'sqlite:///{self.db_path}')
+        self.open_database()
         Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE {PROGRESS_TABLE} (resume_key TEXT NOT NULL, rows_written INTEGER NOT NULL)"
+            ))
+        return 0
+    
+    def open_database(self) -> None:
+        """
+        Connect to the existing database without recreating it, e.g. to read
+        back a database written by an earlier run.
+        """
+        self.engine = create_engine(f'sqlite:///{self.db_path}')
         self.Session = sessionmaker(bind=self.engine)
     
-    def transform(self, data: Dict[str, Any]) -> List[Base]:
+    def _read_progress(self, resume_key: str) -> int:
+        if not os.path.exists(self.db_path):
+            return 0
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute(
+                f"SELECT rows_written FROM {PROGRESS_TABLE} WHERE resume_key = ?", (resume_key,)
+            ).fetchone()
+        except sqlite3.Error:
+            # No progress table: the database is complete or was not written by us
+            return 0
+        finally:
+            conn.close()
+        return row[0] if row else 0
+    
+    def quarantine(self, record: Any, error: Union[Exception, str], **context: Any) -> None:
+        """
+        Set aside a malformed input record instead of failing the whole transformation.
+        
+        Args:
+            record: The rejected raw record
+            error: Why it was rejected
+            context: Extra fields stored with it (e.g. its index in the input)
+        """
+        logging.warning(f"Quarantined malformed record {context}: {error}")
+        self.quarantined.append({**context, "error": str(error), "record": record})
+    
+    def transform(self, data: Dict[str, Any]) -> Iterable[Base]:
         """
         Transform JSON data into SQLAlchemy model instances.
         
@@ -38,7 +116,9 @@ class DataTransformer:
             data: Dictionary containing the JSON data
             
         Returns:
-            List of SQLAlchemy model instances to be saved to the database
+            SQLAlchemy model instances to be saved to the database, in order.
+            PendingRows buffers may be included to insert many rows in bulk;
+            returning a generator lets them be written as they are produced.
         """
         raise NotImplementedError("Subclasses must implement transform method")
     
@@ -54,6 +134,18 @@ class DataTransformer:
         conn.close()
         return "\n\n".join(schema)
 
+    def compact(self) -> None:
+        """
+        Rebuild the database file without free pages so it is as small as
+        possible before compression and encryption.
+        """
+        self.engine.dispose()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
     def process(self, data: Dict[str, Any]) -> None:
         """
         Process the data transformation and save to database.
@@ -62,15 +154,99 @@ class DataTransformer:
         Args:
             data: Dictionary containing the JSON data
         """
+        self.write(self.transform(data))
+
+    def write(self, models: Iterable[Base], resume_key: Optional[str] = None) -> None:
+        """
+        Save transformed model instances to the database.
+        
+        Models are consumed as they arrive, so a generator returned by transform is
+        written while it is still producing. PendingRows are committed batch by batch
+        together with the number of rows written so far, so if a write fails, running
+        it again with the same resume_key continues after the last committed batch
+        instead of starting from zero. The columnar export (if any) is appended chunk
+        by chunk and only moved into place once the final commit succeeded.
+        
+        Args:
+            models: Output of transform
+            resume_key: Identifies the input being written, e.g. a digest of its content
+        """
+        resume_rows = 0
+        if self.Session is None:
+            resume_rows = self._initialize_database(resume_key)
+        
+        columnar = None
+        if self.columnar_format:
+            columnar = ColumnarWriter(os.path.dirname(self.db_path) or ".", self.columnar_format)
+        exported_models: List[Base] = []
+        
         session = self.Session()
         try:
-            # Transform data into model instances
-            models = self.transform(data)
+            rows = 0
+            table_rows: Dict[str, int] = {}
             for model in models:
-                session.add(model)
+                if isinstance(model, PendingRows):
+                    table = model.table
+                    # Bulk rows reference ORM objects added before them
+                    session.flush()
+                    model.prepare(table_rows.get(table.name, 0))
+                    start = min(len(model), max(0, resume_rows - rows))
+                    while start < len(model):
+                        # Sized from the memory left now, as boundaries need not match an earlier run
+                        end = min(len(model), start + self.memory_budget.batch_size(WRITE_BATCH_SIZE))
+                        model.write_batch(session, start, end)
+                        self._commit_progress(session, rows + end, resume_key)
+                        start = end
+                    if columnar is not None and self._exports(table):
+                        # Rows committed by an earlier run are exported too
+                        columnar.write(table.name, model.columns())
+                    count = len(model)
+                else:
+                    table = model.__table__
+                    if rows >= resume_rows:
+                        session.add(model)
+                    if columnar is not None and self._exports(table):
+                        exported_models.append(model)
+                    count = 1
+                rows += count
+                table_rows[table.name] = table_rows.get(table.name, 0) + count
+            session.execute(text(f"DROP TABLE IF EXISTS {PROGRESS_TABLE}"))
             session.commit()
+            if columnar is not None:
+                # Only publish files once the rows are committed, so a failed write leaves no orphan files
+                self._export_models(columnar, exported_models)
+                self.columnar_paths = columnar.close()
         except Exception as e:
             session.rollback()
+            if columnar is not None:
+                columnar.abort()
             raise e
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+
+    def _commit_progress(self, session, rows: int, resume_key: Optional[str]) -> None:
+        """Commit pending work together with the number of rows it completes."""
+        session.execute(text(f"DELETE FROM {PROGRESS_TABLE}"))
+        session.execute(
+            text(f"INSERT INTO {PROGRESS_TABLE} (resume_key, rows_written) VALUES (:resume_key, :rows)"),
+            {"resume_key": resume_key or "", "rows": rows}
+        )
+        session.commit()
+
+    def _exports(self, table) -> bool:
+        """Return True if a table is included in the columnar export."""
+        return not self.columnar_tables or table.name in self.columnar_tables
+
+    def _export_models(self, columnar: ColumnarWriter, models: List[Base]) -> None:
+        """
+        Append committed ORM model instances to the columnar export, after any
+        bulk rows of the same table.
+        """
+        tables: Dict[str, Dict[str, List[Any]]] = {}
+        for model in models:
+            table = model.__table__
+            columns = tables.setdefault(table.name, {column.name: [] for column in table.columns})
+            for column in table.columns:
+                columns[column.name].append(getattr(model, column.key))
+        for table_name, columns in tables.items():
+            columnar.write(table_name, columns)
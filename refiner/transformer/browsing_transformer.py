@@ -1,36 +1,44 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Sequence
 from datetime import datetime
 import statistics
+from refiner.models.pending import PendingBrowsingEntries, ValueDictionary, WRITE_BATCH_SIZE
 from refiner.models.refined import Base, BrowsingAuthor, BrowsingEntry, BrowsingStats
 from refiner.transformer.base_transformer import DataTransformer
 from refiner.utils.date import parse_timestamp
+from refiner.utils.validation import original_index
 
 class BrowsingTransformer(DataTransformer):
     """
     Transformer for browsing data.
     """
+
+    columnar_tables = ('browsing_entries', 'browsing_stats')
     
-    def determine_browsing_type(self, urls: List[str]) -> str:
+    def determine_browsing_type(self, urls: List[str], counts: Optional[List[int]] = None) -> str:
         """
         Determine the type of browsing based on URLs.
         
         Args:
             urls: List of URLs
+            counts: Optional number of occurrences of each URL, so repeated
+                URLs can be passed once
             
         Returns:
             String indicating the browsing type
         """
-        # Simple logic to determine browsing type
-        domains = [self._extract_domain(url) for url in urls]
+        if counts is None:
+            counts = [1] * len(urls)
         
         # Check for common categories
         ecommerce_domains = ['amazon', 'ebay', 'shopify']
         social_domains = ['facebook', 'twitter', 'instagram', 'linkedin','x']
         news_domains = ['cnn', 'bbc', 'nytimes', 'reuters']
         
+        # Simple logic to determine browsing type
         domain_counts = {}
-        for domain in domains:
-            domain_counts[domain] = domain_counts.get(domain, 0) + 1
+        for url, count in zip(urls, counts):
+            domain = self._extract_domain(url)
+            domain_counts[domain] = domain_counts.get(domain, 0) + count
         
         # Find most common domain
         if not domain_counts:
@@ -79,18 +87,30 @@ class BrowsingTransformer(DataTransformer):
         except Exception:
             return "unknown"
     
-    def transform(self, data: Dict[str, Any]) -> List[Base]:
+    def transform(self, data: Dict[str, Any], removed_indices: Sequence[int] = ()) -> Iterator[Base]:
         """
         Transform raw browsing data into SQLAlchemy model instances.
         
+        The input is checked and the author built right away, so a malformed file
+        fails here; entries are then produced lazily as they are buffered.
+        
         Args:
             data: Dictionary containing browsing data
+            removed_indices: Sorted indices of entries already removed from the input
+                (e.g. rejected by validation), so quarantined entries are reported
+                by their index in the original file
             
         Returns:
-            List of SQLAlchemy model instances
+            Iterator over the author, chunks of entries buffered in
+            PendingBrowsingEntries, and finally the stats
+        
+        Raises:
+            AttributeError, TypeError, ValueError: If the input is malformed outside its entries
         """
         # Extract data
         browsing_data = data.get('data', {}).get('browsingDataArray', [])
+        if not isinstance(browsing_data, list):
+            raise TypeError(f"browsingDataArray must be an array, got {type(browsing_data).__name__}")
         created_time = parse_timestamp(data.get('created_time', 0))
         author_id = data.get('author', '')
         
@@ -100,37 +120,62 @@ class BrowsingTransformer(DataTransformer):
             created_time=created_time
         )
         
-        models = [author]
+        # The columnar export needs one type for time spent across all chunks, so look ahead
+        float_time_spent = any(
+            isinstance(entry, dict) and isinstance(entry.get('timeSpent'), float)
+            and not (entry['timeSpent'].is_integer() and -2**63 <= entry['timeSpent'] < 2**63)
+            for entry in browsing_data
+        )
         
-        # URLs and timestamps for stats calculation
-        urls = []
-        time_spent_values = []
+        return self._transform_entries(author, browsing_data, removed_indices, float_time_spent)
+    
+    def _transform_entries(self, author: BrowsingAuthor, browsing_data: List[Any],
+                           removed_indices: Sequence[int], float_time_spent: bool) -> Iterator[Base]:
+        """
+        Yield the author, the entries in chunks sized from the memory budget, and the stats.
         
-        # Process browsing entries
-        for entry in browsing_data:
-            url = entry.get('url', '')
-            time_spent = entry.get('timeSpent', 0)
-            timestamp = parse_timestamp(entry.get('timestamp', 0))
-            
-            # Create browsing entry
-            browsing_entry = BrowsingEntry(
-                author_id=author_id,
-                url=url,
-                time_spent=time_spent,
-                timestamp=timestamp
-            )
+        Args:
+            author: The browsing author the entries belong to
+            browsing_data: Raw browsing entries
+            removed_indices: See transform
+            float_time_spent: Export time spent as float64 rather than int64
+        """
+        author_id = author.author_id
+        yield author
+        
+        # Buffer entries column-wise, with URLs dictionary-encoded across all chunks
+        urls = ValueDictionary()
+        url_count = 0
+        total_time_spent = 0
+        chunk_size = self.memory_budget.batch_size(WRITE_BATCH_SIZE)
+        entries = PendingBrowsingEntries(author_id, urls, float_time_spent)
+        
+        # Process browsing entries, quarantining malformed ones
+        for index, entry in enumerate(browsing_data):
+            try:
+                time_spent = entry.get('timeSpent', 0)
+                entries.append(entry.get('url', ''), time_spent, entry.get('timestamp', 0))
+            except (AttributeError, TypeError, ValueError, OverflowError, OSError) as e:
+                self.quarantine(entry, e, index=original_index(index, removed_indices))
+                continue
+            url_count += 1
+            total_time_spent += time_spent
             
-            models.append(browsing_entry)
-            urls.append(url)
-            time_spent_values.append(time_spent)
+            if len(entries) >= chunk_size:
+                # Hand the chunk to the writer while the next one is filled
+                yield entries
+                chunk_size = self.memory_budget.batch_size(WRITE_BATCH_SIZE)
+                entries = PendingBrowsingEntries(author_id, urls, float_time_spent)
+        
+        if len(entries):
+            yield entries
         
         # Calculate stats
-        url_count = len(urls)
         average_time_spent = 0
-        if time_spent_values:
-            average_time_spent = sum(time_spent_values) / len(time_spent_values)
+        if url_count:
+            average_time_spent = total_time_spent / url_count
         
-        browsing_type = self.determine_browsing_type(urls)
+        browsing_type = self.determine_browsing_type(urls.values, urls.counts)
         
         # Create stats
         stats = BrowsingStats(
@@ -140,9 +185,7 @@ class BrowsingTransformer(DataTransformer):
             browsing_type=browsing_type
         )
         
-        models.append(stats)
-        
-        return models
+        yield stats
     
     def get_output_data(self):
         """
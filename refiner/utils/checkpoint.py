@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Optional
+
+
+class Checkpoint:
+    """
+    Completed stages per input file, persisted as JSON in the output directory so
+    re-running an interrupted (or finished) run skips what is already done.
+
+    Inputs are identified by a key the caller derives from their name, content and
+    the settings that shape their artifacts, so changing any of these refines the
+    input again. db.libsql, its encrypted copy and the columnar files are shared by
+    all inputs and only hold the one written last: claim_database drops the stages
+    describing them for every other input.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.key: Optional[str] = None
+        self.state = {"database": None, "inputs": {}}
+        # Stages are looked up from pipeline threads while the writer records them
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable checkpoint at {path}: {e}")
+            else:
+                if isinstance(state, dict) and isinstance(state.get("inputs"), dict):
+                    self.state = state
+                else:
+                    logging.warning(f"Ignoring checkpoint at {path} written in an older format")
+
+    def begin(self, source: str, key: str) -> bool:
+        """
+        Start (or resume) refining an input; later calls to get and complete refer to it.
+
+        Args:
+            source: Input filename
+            key: Identifies the input's content and artifact settings
+
+        Returns:
+            True if a checkpoint for the same input was found and is being resumed
+        """
+        with self._lock:
+            self.key = key
+            entry = self.state["inputs"].get(key)
+            if entry is not None:
+                logging.info(f"Resuming {source} from checkpoint with completed stages: {list(entry['stages'])}")
+                return True
+            self.state["inputs"][key] = {"source": source, "stages": {}}
+            self._save()
+            return False
+
+    def get(self, stage: str, key: Optional[str] = None) -> Optional[Any]:
+        """Return the recorded result of a completed stage of the current (or given) input, or None."""
+        with self._lock:
+            entry = self.state["inputs"].get(key or self.key)
+            return entry["stages"].get(stage) if entry is not None else None
+
+    def complete(self, stage: str, result: Any = True) -> None:
+        """Record a stage of the current input as completed along with its result."""
+        with self._lock:
+            self.state["inputs"][self.key]["stages"][stage] = result
+            self._save()
+
+    def holds_database(self) -> bool:
+        """Return True if the shared output files were last written for the current input."""
+        return self.state["database"] == self.key
+
+    def claim_database(self) -> None:
+        """
+        Record that the shared output files are about to be (re)written for the current
+        input, invalidating what other inputs recorded about them.
+        """
+        with self._lock:
+            if self.state["database"] == self.key:
+                return
+            for entry in self.state["inputs"].values():
+                stages = entry["stages"]
+                for stage in [stage for stage in stages if stage == "written" or stage.startswith("encrypted:")]:
+                    del stages[stage]
+            self.state["database"] = self.key
+            self._save()
+
+    def _save(self) -> None:
+        # Write then rename so a crash never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
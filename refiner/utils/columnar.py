@@ -0,0 +1,114 @@
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+from refiner.models.pending import DictionaryColumn, TimestampColumn
+
+COLUMNAR_EXTENSIONS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+
+class ColumnarWriter:
+    """Appends tables to columnar files (Parquet or Arrow IPC), one file per table.
+
+    Each call to write appends one batch of rows, so a table can be exported
+    chunk by chunk without holding it in memory. Files are written under a
+    temporary name and only moved into place by close; abort removes them.
+
+    pyarrow is a required dependency, but it is imported on first use so runs
+    without a columnar export do not spend time and memory loading it.
+    """
+
+    def __init__(self, output_dir: str, fmt: str):
+        """
+        Args:
+            output_dir: Directory to write the files to
+            fmt: Either 'parquet' or 'arrow'
+        """
+        fmt = fmt.lower()
+        if fmt not in COLUMNAR_EXTENSIONS:
+            raise ValueError(f"Unsupported columnar format: {fmt} (expected one of {list(COLUMNAR_EXTENSIONS)})")
+
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+
+        self._pa, self._ipc, self._pq = pa, ipc, pq
+        self.output_dir = output_dir
+        self.fmt = fmt
+        # Table name to [final path, open sink, open writer, schema, rows written]
+        self._files: Dict[str, List[Any]] = {}
+        # Converted dictionaries per (table, column): the source list and its pyarrow array
+        self._dictionaries: Dict[Tuple[str, str], Tuple[List[Any], Any]] = {}
+
+    def write(self, table_name: str, columns: Dict[str, Any]) -> None:
+        """
+        Append rows to a table's file.
+
+        Args:
+            table_name: Name of the table, used as the file name
+            columns: Column name to a sequence of values, a DictionaryColumn written
+                as a dictionary-encoded array, or a TimestampColumn written as timestamp[us]
+        """
+        pa = self._pa
+        table = pa.table({name: self._to_arrow(table_name, name, values) for name, values in columns.items()})
+
+        entry = self._files.get(table_name)
+        if entry is None:
+            path = os.path.join(self.output_dir, f"{table_name}{COLUMNAR_EXTENSIONS[self.fmt]}")
+            if self.fmt == "parquet":
+                sink, writer = None, self._pq.ParquetWriter(f"{path}.tmp", table.schema)
+            else:
+                sink = pa.OSFile(f"{path}.tmp", 'wb')
+                # Later chunks extend a shared dictionary, which IPC files store as deltas
+                options = self._ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                writer = self._ipc.new_file(sink, table.schema, options=options)
+            entry = self._files[table_name] = [path, sink, writer, table.schema, 0]
+        elif not table.schema.equals(entry[3]):
+            table = table.cast(entry[3])
+
+        entry[2].write_table(table)
+        entry[4] += table.num_rows
+
+    def close(self) -> List[str]:
+        """Finish every file and move it into place, returning their paths."""
+        paths = []
+        for table_name, (path, sink, writer, _, rows) in self._files.items():
+            writer.close()
+            if sink is not None:
+                sink.close()
+            os.replace(f"{path}.tmp", path)
+            logging.info(f"Wrote {rows} rows of {table_name} to {path}")
+            paths.append(path)
+        self._files = {}
+        return paths
+
+    def abort(self) -> None:
+        """Discard every file written so far."""
+        for path, sink, writer, _, _ in self._files.values():
+            try:
+                writer.close()
+                if sink is not None:
+                    sink.close()
+            finally:
+                if os.path.exists(f"{path}.tmp"):
+                    os.remove(f"{path}.tmp")
+        self._files = {}
+
+    def _to_arrow(self, table_name: str, name: str, values: Any):
+        """Convert one column to a pyarrow array."""
+        pa = self._pa
+        if isinstance(values, DictionaryColumn):
+            # Chunks may share one growing list of values: only convert the values added since
+            source, dictionary = self._dictionaries.get((table_name, name), (None, None))
+            if source is not values.values:
+                dictionary = pa.array(values.values[:])
+            elif len(dictionary) < len(values.values):
+                dictionary = pa.concat_arrays([dictionary, pa.array(values.values[len(dictionary):])])
+            self._dictionaries[(table_name, name)] = (values.values, dictionary)
+            return pa.DictionaryArray.from_arrays(pa.array(values.indices, pa.uint32()), dictionary)
+        if isinstance(values, TimestampColumn):
+            return pa.array(values.micros, pa.int64()).cast(pa.timestamp('us'))
+        return pa.array(values)
@@ -1,30 +1,85 @@
+import tempfile
+import time
 import pgpy
 from pgpy.constants import CompressionAlgorithm, HashAlgorithm
 import os
 from refiner.config import settings
 
+# The zstd artifact format is recorded in the OpenPGP literal data filename.
+# pgp artifacts are built from an in-memory buffer and always carry an empty filename.
+ZSTD_SUFFIX = '.zst'
+ARTIFACT_FORMATS = ('pgp', 'zstd')
+CHUNK_SIZE = 1024 * 1024
 
-def encrypt_file(encryption_key: str, file_path: str, output_path: str = None) -> str:
+
+def _zstd():
+    # Required dependency, imported on first use as only the zstd artifact format needs it
+    import zstandard
+    return zstandard
+
+
+def compress_file(file_path: str, output_path: str, level: int) -> str:
+    """Streams a file through a zstd compressor.
+
+    Args:
+        file_path: Path to the file to compress
+        output_path: Path to write the zstd frame to
+        level: zstd compression level
+
+    Returns:
+        Path to the compressed file
+    """
+    compressor = _zstd().ZstdCompressor(level=level)
+    with open(file_path, 'rb') as f, open(output_path, 'wb') as out:
+        with compressor.stream_writer(out, closefd=False) as writer:
+            while chunk := f.read(CHUNK_SIZE):
+                writer.write(chunk)
+    return output_path
+
+
+def encrypt_file(encryption_key: str, file_path: str, output_path: str = None,
+                 artifact_format: str = None, compression_level: int = None) -> str:
     """Symmetrically encrypts a file with an encryption key.
 
     Args:
         encryption_key: The passphrase to encrypt with
         file_path: Path to the file to encrypt
         output_path: Optional path to save encrypted file (defaults to file_path + .pgp)
+        artifact_format: 'pgp' (OpenPGP ZLIB compression) or 'zstd' (zstd-compressed
+            before encryption). Defaults to settings.ARTIFACT_FORMAT
+        compression_level: zstd level (defaults to settings.ZSTD_LEVEL)
 
     Returns:
         Path to encrypted file
     """
     if output_path is None:
         output_path = f"{file_path}.pgp"
+    if artifact_format is None:
+        artifact_format = settings.ARTIFACT_FORMAT
+    if artifact_format not in ARTIFACT_FORMATS:
+        raise ValueError(f"Unsupported artifact format: {artifact_format} (expected one of {list(ARTIFACT_FORMATS)})")
     
-    with open(file_path, 'rb') as f:
-        buffer = f.read()
+    if artifact_format == 'zstd':
+        if compression_level is None:
+            compression_level = settings.ZSTD_LEVEL
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp_dir:
+            # Building the message from a file named *.zst stores that name as its literal filename
+            compressed_path = os.path.join(tmp_dir, os.path.basename(file_path) + ZSTD_SUFFIX)
+            compress_file(file_path, compressed_path, compression_level)
+            message = pgpy.PGPMessage.new(
+                compressed_path, file=True, format='b', compression=CompressionAlgorithm.Uncompressed
+            )
+    else:
+        with open(file_path, 'rb') as f:
+            buffer = f.read()
+        message = pgpy.PGPMessage.new(buffer, compression=CompressionAlgorithm.ZLIB)
+        del buffer
     
-    message = pgpy.PGPMessage.new(buffer, compression=CompressionAlgorithm.ZLIB)
     encrypted_message = message.encrypt(
         passphrase=encryption_key, hash=HashAlgorithm.SHA512
     )
+    # Release the plaintext before the armored ciphertext is built
+    del message
     
     with open(output_path, 'wb') as f:
         f.write(str(encrypted_message).encode())
@@ -54,16 +109,74 @@ def decrypt_file(encryption_key: str, file_path: str, output_path: str = None) -
     
     message = pgpy.PGPMessage.from_blob(encrypted_data)
     decrypted_message = message.decrypt(encryption_key)
+    plaintext = decrypted_message.message
+    if isinstance(plaintext, str):
+        plaintext = plaintext.encode()
     
     with open(output_path, 'wb') as f:
-        f.write(decrypted_message.message)
+        if decrypted_message.filename.endswith(ZSTD_SUFFIX):
+            # zstd artifact format: transparently decompress
+            with _zstd().ZstdDecompressor().stream_writer(f, closefd=False) as writer:
+                writer.write(plaintext)
+        else:
+            f.write(plaintext)
     
     return output_path
 
+
+def benchmark_artifact_formats(encryption_key: str, file_path: str, zstd_levels=(1, 3, 10, 19)) -> list:
+    """Compares encrypted artifact size and encrypt/decrypt time across artifact formats.
+
+    Args:
+        encryption_key: The passphrase to encrypt with
+        file_path: Path to the file to benchmark (typically db.libsql)
+        zstd_levels: zstd levels to try
+
+    Returns:
+        One result dictionary per format/level
+    """
+    candidates = [('pgp', None)] + [('zstd', level) for level in zstd_levels]
+    original_size = os.path.getsize(file_path)
+    results = []
+    for artifact_format, level in candidates:
+        encrypted_path = f"{file_path}.bench.pgp"
+        decrypted_path = f"{file_path}.bench.decrypted"
+        try:
+            start = time.perf_counter()
+            encrypt_file(encryption_key, file_path, encrypted_path, artifact_format, level)
+            encrypt_seconds = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            decrypt_file(encryption_key, encrypted_path, decrypted_path)
+            decrypt_seconds = time.perf_counter() - start
+            
+            size = os.path.getsize(encrypted_path)
+            results.append({
+                "format": artifact_format if level is None else f"{artifact_format}-{level}",
+                "size": size,
+                "ratio": original_size / size if size else 0,
+                "encrypt_seconds": encrypt_seconds,
+                "decrypt_seconds": decrypt_seconds,
+            })
+        finally:
+            for path in (encrypted_path, decrypted_path):
+                if os.path.exists(path):
+                    os.remove(path)
+    return results
+
 # Test with: python -m refiner.utils.encrypt
+# Benchmark artifact formats with: python -m refiner.utils.encrypt --benchmark
 if __name__ == "__main__":
+    import sys
     plaintext_db = os.path.join(settings.OUTPUT_DIR, "db.libsql")
     
+    if "--benchmark" in sys.argv:
+        print(f"{'format':<10} {'bytes':>12} {'ratio':>7} {'encrypt s':>10} {'decrypt s':>10}")
+        for result in benchmark_artifact_formats(settings.REFINEMENT_ENCRYPTION_KEY, plaintext_db):
+            print(f"{result['format']:<10} {result['size']:>12} {result['ratio']:>7.2f} "
+                  f"{result['encrypt_seconds']:>10.3f} {result['decrypt_seconds']:>10.3f}")
+        sys.exit(0)
+    
     # Encrypt and decrypt
     encrypted_path = encrypt_file(settings.REFINEMENT_ENCRYPTION_KEY, plaintext_db)
     print(f"File encrypted to: {encrypted_path}")
@@ -0,0 +1,206 @@
+import logging
+import queue
+import threading
+import time
+import types
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+class StageMetrics:
+    """
+    Counters collected for one pipeline stage and its input queue.
+
+    `items_in` counts the items a stage took from its input queue and `items_out`
+    those it passed on; they differ for stages that drop items or yield several
+    per input (e.g. one input file in, one item per transformed chunk out).
+    """
+    __slots__ = ('name', 'items_in', 'items_out', 'busy_seconds', 'idle_seconds', 'blocked_seconds',
+                 'queue_max_depth', '_depth_total', '_depth_samples')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.queue_max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def sample_depth(self, depth: int) -> None:
+        self.queue_max_depth = max(self.queue_max_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "idle_seconds": round(self.idle_seconds, 4),
+            "blocked_seconds": round(self.blocked_seconds, 4),
+            "queue_max_depth": self.queue_max_depth,
+            "queue_mean_depth": round(self._depth_total / self._depth_samples, 2) if self._depth_samples else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    Runs a chain of stages in their own threads, connected by bounded queues.
+
+    Each stage is a callable taking one item and returning the item for the next
+    stage, or None to drop it. A stage may also be a generator function, in which
+    case every item it yields is passed on as soon as it is produced, e.g. to split
+    one input into chunks the next stage works on while the rest is produced.
+    Items from the last stage are yielded to the caller's thread, which acts as the
+    final (sink) stage. A full queue blocks the producing stage, so fast stages
+    never run more than `queue_size` items ahead.
+
+    With `max_in_flight`, the source waits before passing on another item until an
+    earlier one was dropped or fully processed by the last stage, so that no more
+    than this many inputs are held by the stages at once (not counting items the
+    last stage already passed to the sink). Stages before the last must then pass
+    on at most one item per input.
+
+    Per stage, `idle_seconds` is time spent waiting for input and `blocked_seconds`
+    time spent waiting for room downstream: the bottleneck is the stage whose
+    input queue stays full while it is rarely idle.
+    """
+
+    def __init__(self, source: Iterable[Any], stages: List[Tuple[str, Callable[[Any], Any]]],
+                 queue_size: int = 2, sink_name: str = "sink", max_in_flight: Optional[int] = None):
+        self.source = source
+        self.stages = stages
+        self.metrics = [StageMetrics(name) for name, _ in stages]
+        self.sink_metrics = StageMetrics(sink_name)
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self._in_flight = threading.Semaphore(max_in_flight) if max_in_flight else None
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def __iter__(self) -> Iterator[Any]:
+        threads = [threading.Thread(target=self._feed, name="pipeline-source", daemon=True)]
+        for index, (name, _) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._run_stage, args=(index,), name=f"pipeline-{name}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(self._queues[-1], self.sink_metrics)
+                if item is _DONE:
+                    break
+                self.sink_metrics.items_in += 1
+                start = time.perf_counter()
+                yield item
+                self.sink_metrics.busy_seconds += time.perf_counter() - start
+                self.sink_metrics.items_out += 1
+                del item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def get_metrics(self) -> List[Dict[str, Any]]:
+        """Return per-stage metrics, including the consuming sink."""
+        return [metrics.to_dict() for metrics in self.metrics + [self.sink_metrics]]
+
+    def log_metrics(self) -> None:
+        for metrics in self.get_metrics():
+            logging.info(f"Pipeline stage metrics: {metrics}")
+
+    def _feed(self) -> None:
+        try:
+            for item in self.source:
+                if not self._acquire_slot() or not self._put(self._queues[0], item, None):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(self._queues[0], _DONE, None)
+
+    def _run_stage(self, index: int) -> None:
+        _, func = self.stages[index]
+        metrics = self.metrics[index]
+        in_queue, out_queue = self._queues[index], self._queues[index + 1]
+        last = index == len(self.stages) - 1
+        while True:
+            item = self._get(in_queue, metrics)
+            if item is _DONE:
+                break
+            metrics.items_in += 1
+            try:
+                start = time.perf_counter()
+                result = func(item)
+                outputs = result if isinstance(result, types.GeneratorType) else iter((result,))
+                output = None
+                passed_on = 0
+                # Time spent producing counts as busy, waiting for room downstream as blocked
+                for output in outputs:
+                    metrics.busy_seconds += time.perf_counter() - start
+                    if output is not None:
+                        if not self._put(out_queue, output, metrics):
+                            return
+                        metrics.items_out += 1
+                        passed_on += 1
+                    start = time.perf_counter()
+                metrics.busy_seconds += time.perf_counter() - start
+            except BaseException as e:
+                self._fail(e)
+                break
+            if last or not passed_on:
+                self._release_slot()
+            # Drop this thread's references so a finished item can be freed while waiting for the next
+            del item, result, outputs, output
+        self._put(out_queue, _DONE, metrics)
+
+    def _acquire_slot(self) -> bool:
+        if self._in_flight is None:
+            return True
+        while not self._in_flight.acquire(timeout=_POLL_SECONDS):
+            if self._stop.is_set():
+                return False
+        return True
+
+    def _release_slot(self) -> None:
+        if self._in_flight is not None:
+            self._in_flight.release()
+
+    def _get(self, in_queue: queue.Queue, metrics: StageMetrics) -> Any:
+        metrics.sample_depth(in_queue.qsize())
+        start = time.perf_counter()
+        while True:
+            try:
+                item = in_queue.get(timeout=_POLL_SECONDS)
+                break
+            except queue.Empty:
+                if self._stop.is_set():
+                    item = _DONE
+                    break
+        metrics.idle_seconds += time.perf_counter() - start
+        return item
+
+    def _put(self, out_queue: queue.Queue, item: Any, metrics: Optional[StageMetrics]) -> bool:
+        start = time.perf_counter()
+        while True:
+            try:
+                out_queue.put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                if self._stop.is_set():
+                    return False
+        if metrics is not None:
+            metrics.blocked_seconds += time.perf_counter() - start
+        return True
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._stop.set()
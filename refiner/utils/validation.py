@@ -0,0 +1,64 @@
+import json
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+from pydantic import TypeAdapter, ValidationError
+
+from refiner.models.unrefined import BrowsingInputDict
+
+# Built once: pydantic compiles the validator into its Rust core on construction
+BROWSING_INPUT_ADAPTER = TypeAdapter(BrowsingInputDict)
+
+ENTRIES_LOC = ('data', 'browsingDataArray')
+
+
+def original_index(position: int, removed: Sequence[int]) -> int:
+    """
+    Map the position of an entry in a filtered array back to its index in the original one.
+
+    Args:
+        position: Index in the array with entries removed
+        removed: Sorted original indices of the removed entries
+    """
+    for index in removed:
+        if index > position:
+            break
+        position += 1
+    return position
+
+
+def validate_browsing_json(raw: Union[bytes, str]) -> Tuple[Dict[str, Any], List[Tuple[int, Any, str]]]:
+    """
+    Parse and strictly validate a browsing data file in a single pass.
+
+    Entries that fail validation are rejected individually rather than failing the
+    whole file; only then is the file re-parsed to recover the rejected records.
+
+    Args:
+        raw: The file's JSON content
+
+    Returns:
+        The validated input as plain dicts (as json.loads would return), and
+        (index, record, error) for each rejected entry, sorted by index. Rejected
+        entries are removed from the input; see original_index.
+
+    Raises:
+        ValidationError: If the file is invalid outside of individual entries
+    """
+    try:
+        return BROWSING_INPUT_ADAPTER.validate_json(raw, strict=True), []
+    except ValidationError as e:
+        errors = e.errors()
+        if not all(error['loc'][:2] == ENTRIES_LOC and len(error['loc']) > 2 for error in errors):
+            raise
+
+    messages = {}
+    for error in errors:
+        index = error['loc'][2]
+        field = '.'.join(str(part) for part in error['loc'][3:])
+        messages.setdefault(index, []).append(f"{field}: {error['msg']}" if field else error['msg'])
+
+    data = json.loads(raw)
+    entries = data['data']['browsingDataArray']
+    rejected = [(index, entries[index], "; ".join(messages[index])) for index in sorted(messages)]
+    data['data']['browsingDataArray'] = [entry for index, entry in enumerate(entries) if index not in messages]
+    return BROWSING_INPUT_ADAPTER.validate_python(data, strict=True), rejected
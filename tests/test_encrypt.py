@@ -0,0 +1,44 @@
+import pytest
+
+from refiner.utils.encrypt import ZSTD_SUFFIX, decrypt_file, encrypt_file
+
+KEY = "test-key"
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "db.libsql"
+    path.write_bytes(b"SQLite format 3\x00" + bytes(range(256)) * 64 + b"browsing_entries" * 512)
+    return path
+
+
+@pytest.mark.parametrize("artifact_format", ["pgp", "zstd"])
+def test_round_trip(tmp_path, database, artifact_format):
+    encrypted_path = encrypt_file(KEY, str(database), artifact_format=artifact_format, compression_level=3)
+    assert encrypted_path == f"{database}.pgp"
+
+    decrypted_path = decrypt_file(KEY, encrypted_path, str(tmp_path / "decrypted"))
+    assert open(decrypted_path, 'rb').read() == database.read_bytes()
+
+
+def test_zstd_leaves_no_temporary_files(database):
+    encrypt_file(KEY, str(database), artifact_format="zstd", compression_level=3)
+    assert sorted(p.name for p in database.parent.iterdir()) == ["db.libsql", "db.libsql.pgp"]
+
+
+def test_pgp_artifact_of_zstd_data_is_not_decompressed(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    # A pgp artifact whose plaintext is a zstd frame, from a file with the zstd suffix
+    path = tmp_path / f"export{ZSTD_SUFFIX}"
+    path.write_bytes(zstandard.ZstdCompressor().compress(b"not to be decompressed" * 100))
+
+    encrypted_path = encrypt_file(KEY, str(path), artifact_format="pgp")
+    decrypted_path = decrypt_file(KEY, encrypted_path, str(tmp_path / "decrypted"))
+
+    assert open(decrypted_path, 'rb').read() == path.read_bytes()
+
+
+def test_wrong_key_fails(tmp_path, database):
+    encrypted_path = encrypt_file(KEY, str(database), artifact_format="zstd", compression_level=3)
+    with pytest.raises(Exception):
+        decrypt_file("other-key", encrypted_path, str(tmp_path / "decrypted"))
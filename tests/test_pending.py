@@ -0,0 +1,93 @@
+from array import array
+
+import pytest
+
+from refiner.models.pending import PendingBrowsingEntries, from_micros, to_micros
+from refiner.models.refined import BrowsingEntry
+from refiner.transformer.browsing_transformer import BrowsingTransformer
+from refiner.utils.date import parse_timestamp
+
+
+def browsing_input(time_spent, timestamps=None):
+    timestamps = timestamps or [1700000000000 + i for i in range(len(time_spent))]
+    return {
+        "author": "alice",
+        "created_time": 1700000000000,
+        "data": {
+            "browsingDataArray": [
+                {"url": f"https://www.bbc.com/p{i}", "timeSpent": value, "timestamp": timestamp}
+                for i, (value, timestamp) in enumerate(zip(time_spent, timestamps))
+            ]
+        },
+    }
+
+
+@pytest.mark.parametrize("time_spent, arrow_type, exported", [
+    ([5, 6, 7], "int64", [5, 6, 7]),
+    ([5, 6.0, 7], "int64", [5, 6, 7]),
+    ([5, 5.5], "double", [5.0, 5.5]),
+])
+def test_columnar_time_spent_type(tmp_path, time_spent, arrow_type, exported):
+    pq = pytest.importorskip("pyarrow.parquet")
+    transformer = BrowsingTransformer(str(tmp_path / "db.libsql"), columnar_format="parquet")
+    transformer.process(browsing_input(time_spent))
+
+    column = pq.read_table(tmp_path / "browsing_entries.parquet").column("time_spent")
+    assert str(column.type) == arrow_type
+    assert column.to_pylist() == exported
+
+
+def read_entries(transformer):
+    session = transformer.Session()
+    try:
+        return [(entry.time_spent, entry.timestamp) for entry in session.query(BrowsingEntry).order_by(BrowsingEntry.entry_id)]
+    finally:
+        session.close()
+
+
+def test_fractional_time_spent_is_kept(tmp_path):
+    transformer = BrowsingTransformer(str(tmp_path / "db.libsql"))
+    transformer.process(browsing_input([5, 5.5]))
+
+    assert [time_spent for time_spent, _ in read_entries(transformer)] == [5, 5.5]
+    output = transformer.get_output_data()
+    assert output["stats"]["averageTimeSpent"] == 5.25
+    assert [entry["timeSpent"] for entry in output["data"]] == [5, 5.5]
+
+
+def test_time_spent_switches_to_list_on_first_float():
+    entries = PendingBrowsingEntries("alice")
+    entries.append("https://www.bbc.com", 5, 1700000000000)
+    entries.append("https://www.bbc.com", 6, 1700000000000)
+    assert isinstance(entries.time_spent, array)
+
+    entries.append("https://www.bbc.com", 5.5, 1700000000000)
+    entries.append("https://www.bbc.com", 7, 1700000000000)
+    assert isinstance(entries.time_spent, list)
+    assert entries.time_spent == [5, 6, 5.5, 7]
+    assert [type(value) for value in entries.time_spent] == [int, int, float, int]
+
+
+@pytest.mark.parametrize("time_spent", ["5", None, [5]])
+def test_non_numeric_time_spent_is_rejected(time_spent):
+    entries = PendingBrowsingEntries("alice")
+    with pytest.raises(TypeError):
+        entries.append("https://www.bbc.com", time_spent, 1700000000000)
+    assert len(entries) == 0
+
+
+@pytest.mark.parametrize("timestamp", [
+    "2024-03-01T10:00:00Z",
+    "2024-03-01T10:00:00.123456Z",
+    "2024-03-01T10:00:00.5+02:00",
+    "1969-07-20T20:17:40",
+    1700000000123,
+])
+def test_timestamp_round_trip(tmp_path, timestamp):
+    transformer = BrowsingTransformer(str(tmp_path / "db.libsql"))
+    transformer.process(browsing_input([1], [timestamp]))
+
+    # DateTime columns on SQLite keep the wall-clock fields and drop any UTC offset
+    [(_, stored)] = read_entries(transformer)
+    assert stored == parse_timestamp(timestamp).replace(tzinfo=None)
+    assert from_micros(to_micros(parse_timestamp(timestamp))) == stored
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from refiner.utils.pipeline import Pipeline
+
+
+def pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("pipeline-")]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_stages_run_in_order():
+    pipeline = Pipeline(range(10), [("double", lambda x: x * 2), ("drop_odd", lambda x: x if x % 4 == 0 else None)])
+
+    assert list(pipeline) == [0, 4, 8, 12, 16]
+    metrics = {stage["stage"]: stage for stage in pipeline.get_metrics()}
+    assert (metrics["double"]["items_in"], metrics["double"]["items_out"]) == (10, 10)
+    assert (metrics["drop_odd"]["items_in"], metrics["drop_odd"]["items_out"]) == (10, 5)
+    assert metrics["sink"]["items_in"] == 5
+
+
+def test_stage_error_reaches_sink():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    received = []
+    with pytest.raises(ValueError, match="bad item"):
+        for item in Pipeline(range(10), [("check", fail_on_three)]):
+            received.append(item)
+
+    assert received == [0, 1, 2]
+    assert wait_for(lambda: not pipeline_threads())
+
+
+def test_threads_stop_when_sink_raises():
+    pipeline = Pipeline(range(1000), [("identity", lambda x: x)], queue_size=1)
+
+    with pytest.raises(RuntimeError, match="sink failed"):
+        for item in pipeline:
+            if item == 2:
+                raise RuntimeError("sink failed")
+
+    # The stages are blocked on full queues and must notice the stop
+    assert wait_for(lambda: not pipeline_threads())
+    assert pipeline.get_metrics()[0]["items_in"] < 1000
+
+
+def test_generator_stage_passes_items_on_before_finishing():
+    first_item_received = threading.Event()
+    finished_before_first_item = []
+
+    def split(x):
+        yield (x, 0)
+        # Only continues once the sink got the first item, which it can't if items waited for the generator to finish
+        finished_before_first_item.append(not first_item_received.wait(timeout=5))
+        yield (x, 1)
+
+    received = []
+    for item in Pipeline(["file"], [("split", split)]):
+        received.append(item)
+        first_item_received.set()
+
+    assert received == [("file", 0), ("file", 1)]
+    assert finished_before_first_item == [False]
+
+
+def test_bounded_queues_block_producer():
+    produced = []
+
+    def source():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    pipeline = Pipeline(source(), [("identity", lambda x: x)], queue_size=1)
+    iterator = iter(pipeline)
+    assert next(iterator) == 0
+    time.sleep(0.5)
+
+    # One item in the sink, one per queue, one held by each thread blocked on a full queue
+    assert len(produced) <= 5
+    assert list(iterator) == list(range(1, 100))
+    assert pipeline.get_metrics()[0]["blocked_seconds"] > 0
+
+
+def test_max_in_flight_waits_for_last_stage():
+    events = []
+
+    def read(x):
+        events.append(("read", x))
+        # Dropped inputs must free their slot too
+        return None if x == 1 else x
+
+    def split(x):
+        for part in range(3):
+            yield (x, part)
+        events.append(("split", x))
+
+    pipeline = Pipeline(range(4), [("read", read), ("split", split)], queue_size=5, max_in_flight=1)
+
+    assert list(pipeline) == [(x, part) for x in (0, 2, 3) for part in range(3)]
+    assert events == [
+        ("read", 0), ("split", 0), ("read", 1), ("read", 2), ("split", 2), ("read", 3), ("split", 3),
+    ]
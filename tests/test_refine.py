@@ -0,0 +1,218 @@
+import json
+import sqlite3
+
+import pytest
+
+import refiner.refine as refine
+from refiner.config import settings
+from refiner.utils.checkpoint import Checkpoint
+from refiner.utils.memory import MemoryBudgetExceeded
+
+
+@pytest.fixture
+def refiner_dirs(tmp_path, monkeypatch):
+    input_dir, output_dir = tmp_path / "input", tmp_path / "output"
+    input_dir.mkdir()
+    output_dir.mkdir()
+    monkeypatch.setattr(settings, "INPUT_DIR", str(input_dir))
+    monkeypatch.setattr(settings, "OUTPUT_DIR", str(output_dir))
+    monkeypatch.setattr(settings, "REFINEMENT_ENCRYPTION_KEY", "test-key")
+    monkeypatch.setattr(settings, "COLUMNAR_FORMAT", None)
+    monkeypatch.setattr(settings, "VALIDATED_INGESTION", False)
+
+    uploads = []
+
+    def upload_file(path):
+        uploads.append(path)
+        return f"Qm{len(uploads)}"
+
+    monkeypatch.setattr(refine, "upload_file_to_ipfs", upload_file)
+    monkeypatch.setattr(refine, "upload_json_to_ipfs", lambda data: "QmSchema")
+    return input_dir, output_dir, uploads
+
+
+def write_input(input_dir, name, data):
+    (input_dir / name).write_text(json.dumps(data))
+
+
+def browsing_input(author, entries=3):
+    return {
+        "author": author,
+        "created_time": 1700000000000,
+        "data": {
+            "browsingDataArray": [
+                {"url": f"https://www.bbc.com/p{i}", "timeSpent": 10, "timestamp": 1700000000000 + i}
+                for i in range(entries)
+            ]
+        },
+    }
+
+
+@pytest.mark.parametrize("malformed", [
+    ["not", "an", "object"],
+    {**browsing_input("bob"), "created_time": "not-a-date"},
+    {**browsing_input("bob"), "data": {"browsingDataArray": 42}},
+])
+def test_malformed_file_is_skipped(refiner_dirs, malformed):
+    input_dir, output_dir, uploads = refiner_dirs
+    write_input(input_dir, "bad.json", malformed)
+    write_input(input_dir, "good.json", browsing_input("alice"))
+
+    output = refine.Refiner().transform()
+
+    assert output.browsing_data.stats.urls == 3
+    assert uploads == [str(output_dir / "db.libsql.pgp")]
+    conn = sqlite3.connect(output_dir / "db.libsql")
+    try:
+        assert conn.execute("SELECT author_id FROM browsing_authors").fetchall() == [("alice",)]
+    finally:
+        conn.close()
+
+
+def test_malformed_entries_are_quarantined(refiner_dirs):
+    input_dir, output_dir, _ = refiner_dirs
+    data = browsing_input("alice")
+    data["data"]["browsingDataArray"].insert(1, {"url": "https://www.bbc.com", "timeSpent": 1, "timestamp": "later"})
+    write_input(input_dir, "input.json", data)
+
+    output = refine.Refiner().transform()
+
+    assert output.quarantined_entries == 1
+    assert output.browsing_data.stats.urls == 3
+    quarantined = [json.loads(line) for line in (output_dir / "quarantine" / "input.json.jsonl").read_text().splitlines()]
+    assert [record["index"] for record in quarantined] == [1]
+
+
+def test_completed_stages_are_skipped_on_rerun(refiner_dirs):
+    input_dir, output_dir, uploads = refiner_dirs
+    write_input(input_dir, "input.json", browsing_input("alice"))
+
+    first = refine.Refiner().transform()
+    second = refine.Refiner().transform()
+
+    assert len(uploads) == 1
+    assert second.refinement_url == first.refinement_url
+    assert second.browsing_data == first.browsing_data
+
+
+def test_finished_inputs_are_skipped_on_rerun(refiner_dirs):
+    input_dir, output_dir, uploads = refiner_dirs
+    for author in ("alice", "bob", "carol"):
+        write_input(input_dir, f"{author}.json", browsing_input(author))
+
+    first = refine.Refiner().transform()
+    uploaded = len(uploads)
+    db_mtime = (output_dir / "db.libsql").stat().st_mtime_ns
+    second = refine.Refiner().transform()
+
+    assert uploaded == 3
+    assert len(uploads) == uploaded
+    assert (output_dir / "db.libsql").stat().st_mtime_ns == db_mtime
+    assert second.model_dump(exclude={"pipeline_metrics"}) == first.model_dump(exclude={"pipeline_metrics"})
+
+
+def test_changed_settings_refine_inputs_again(refiner_dirs, monkeypatch):
+    input_dir, output_dir, uploads = refiner_dirs
+    for author in ("alice", "bob"):
+        write_input(input_dir, f"{author}.json", browsing_input(author))
+
+    refine.Refiner().transform()
+    monkeypatch.setattr(settings, "COLUMNAR_FORMAT", "parquet")
+    output = refine.Refiner().transform()
+
+    assert len(uploads) == 2 + 2 * 3
+    assert sorted(output.columnar_refinement_urls) == ["browsing_entries.parquet", "browsing_stats.parquet"]
+
+
+def test_checkpoint_is_discarded_for_changed_input(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path)
+    assert not checkpoint.begin("input.json", "digest")
+    checkpoint.complete("written", {"quarantined": 0})
+
+    resumed = Checkpoint(path)
+    assert resumed.begin("input.json", "digest")
+    assert resumed.get("written") == {"quarantined": 0}
+
+    changed = Checkpoint(path)
+    assert not changed.begin("input.json", "other-digest")
+    assert changed.get("written") is None
+
+
+def test_claiming_database_invalidates_other_inputs(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.begin("a.json", "a")
+    checkpoint.claim_database()
+    checkpoint.complete("written", {"quarantined": 0})
+    checkpoint.complete("uploaded:db.libsql", "QmA")
+    checkpoint.complete("published", {"refinement_hash": "QmA"})
+
+    checkpoint.begin("b.json", "b")
+    checkpoint.claim_database()
+
+    assert checkpoint.holds_database()
+    assert checkpoint.get("written", "a") is None
+    # Uploads and published results stay valid after the local files are replaced
+    assert checkpoint.get("uploaded:db.libsql", "a") == "QmA"
+    assert checkpoint.get("published", "a") == {"refinement_hash": "QmA"}
+
+
+@pytest.mark.parametrize("artifact_format", ["pgp", "zstd"])
+def test_input_too_large_to_encrypt_fails_before_refining(refiner_dirs, monkeypatch, artifact_format):
+    input_dir, output_dir, uploads = refiner_dirs
+    write_input(input_dir, "input.json", browsing_input("alice"))
+    monkeypatch.setattr(settings, "ARTIFACT_FORMAT", artifact_format)
+    # Below the memory pgpy needs to derive the encryption key
+    monkeypatch.setattr(settings, "MEMORY_BUDGET_MB", 64)
+
+    with pytest.raises(MemoryBudgetExceeded):
+        refine.Refiner().transform()
+    assert not (output_dir / "db.libsql").exists()
+    assert uploads == []
+
+
+def test_inputs_are_refined_one_at_a_time_within_budget(refiner_dirs, monkeypatch):
+    input_dir, _, uploads = refiner_dirs
+    for author in ("alice", "bob"):
+        write_input(input_dir, f"{author}.json", browsing_input(author))
+    monkeypatch.setattr(settings, "MEMORY_BUDGET_MB", 64 * 1024)
+
+    output = refine.Refiner().transform()
+
+    assert len(uploads) == 2
+    assert output.browsing_data.stats.urls == 3
+
+
+def test_quarantine_indices_refer_to_original_file(refiner_dirs, monkeypatch):
+    input_dir, output_dir, _ = refiner_dirs
+    monkeypatch.setattr(settings, "VALIDATED_INGESTION", True)
+    data = browsing_input("alice", entries=5)
+    entries = data["data"]["browsingDataArray"]
+    # Rejected by validation (not an integer) before the transform stage sees them
+    entries[0]["timeSpent"] = "ten"
+    entries[2]["timestamp"] = "later"
+    # Valid JSON integer, but out of range when the transform stage parses it
+    entries[3]["timestamp"] = 10 ** 20
+    write_input(input_dir, "input.json", data)
+
+    output = refine.Refiner().transform()
+
+    assert output.quarantined_entries == 3
+    assert output.browsing_data.stats.urls == 2
+    quarantined = [json.loads(line) for line in (output_dir / "quarantine" / "input.json.jsonl").read_text().splitlines()]
+    assert sorted(record["index"] for record in quarantined) == [0, 2, 3]
+    for record in quarantined:
+        assert record["record"] == entries[record["index"]]
+
+
+def test_fractional_time_spent_in_output(refiner_dirs):
+    input_dir, _, _ = refiner_dirs
+    data = browsing_input("alice", entries=2)
+    data["data"]["browsingDataArray"][1]["timeSpent"] = 5.5
+    data["data"]["browsingDataArray"][0]["timeSpent"] = 5
+    write_input(input_dir, "input.json", data)
+
+    output = refine.Refiner().transform()
+
+    assert output.browsing_data.stats.averageTimeSpent == 5.25
+    assert [entry.timeSpent for entry in output.browsing_data.data] == [5, 5.5]
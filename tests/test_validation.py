@@ -0,0 +1,29 @@
+import json
+
+from typing_extensions import get_type_hints
+
+from refiner.models.unrefined import BrowsingData, BrowsingDataDict
+from refiner.utils.validation import validate_browsing_json
+
+
+def test_browsing_data_dict_mirrors_model():
+    fields = BrowsingData.model_fields
+
+    assert get_type_hints(BrowsingDataDict) == {name: field.annotation for name, field in fields.items()}
+    assert BrowsingDataDict.__required_keys__ == {name for name, field in fields.items() if field.is_required()}
+
+
+def test_entry_missing_a_field_is_rejected():
+    raw = json.dumps({
+        "author": "alice",
+        "created_time": 1700000000000,
+        "data": {"browsingDataArray": [
+            {"url": "https://www.bbc.com", "timeSpent": 10, "timestamp": 1700000000000},
+            {"url": "https://www.bbc.com", "timeSpent": 10},
+        ]},
+    })
+
+    data, rejected = validate_browsing_json(raw)
+
+    assert len(data["data"]["browsingDataArray"]) == 1
+    assert [(index, error) for index, _, error in rejected] == [(1, "timestamp: Field required")]
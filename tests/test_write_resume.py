@@ -0,0 +1,141 @@
+import sqlite3
+
+import pytest
+
+import refiner.transformer.base_transformer as base_transformer
+import refiner.transformer.browsing_transformer as browsing_transformer
+from refiner.models.pending import PendingBrowsingEntries
+from refiner.transformer.base_transformer import PROGRESS_TABLE
+from refiner.transformer.browsing_transformer import BrowsingTransformer
+
+ENTRIES = 1050
+
+
+def browsing_input(entries=ENTRIES):
+    return {
+        "author": "alice",
+        "created_time": 1700000000000,
+        "data": {
+            "browsingDataArray": [
+                {"url": f"https://www.cnn.com/p{i % 7}", "timeSpent": i % 100, "timestamp": 1700000000000 + i}
+                for i in range(entries)
+            ]
+        },
+    }
+
+
+def read_entries(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT entry_id, time_spent FROM browsing_entries ORDER BY entry_id").fetchall()
+    finally:
+        conn.close()
+
+
+def has_progress_table(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (PROGRESS_TABLE,)).fetchone() is not None
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # Several chunks and batches per input without generating large inputs
+    monkeypatch.setattr(base_transformer, "WRITE_BATCH_SIZE", 100)
+    monkeypatch.setattr(browsing_transformer, "WRITE_BATCH_SIZE", 300)
+
+
+def crash_on_batch(monkeypatch, crash_at, after_insert):
+    """Make the crash_at-th call to write_batch fail, before or after executing its insert."""
+    write_batch = PendingBrowsingEntries.write_batch
+    calls = []
+
+    def flaky_write_batch(self, session, start, end):
+        calls.append((start, end))
+        if len(calls) == crash_at and not after_insert:
+            raise RuntimeError("simulated crash")
+        write_batch(self, session, start, end)
+        if len(calls) == crash_at:
+            raise RuntimeError("simulated crash")
+
+    monkeypatch.setattr(PendingBrowsingEntries, "write_batch", flaky_write_batch)
+
+
+@pytest.mark.parametrize("after_insert", [False, True])
+@pytest.mark.parametrize("crash_at", [1, 4, 7])
+def test_resume_after_crash_mid_batch(tmp_path, monkeypatch, small_batches, crash_at, after_insert):
+    db_path = str(tmp_path / "db.libsql")
+    data = browsing_input()
+
+    crash_on_batch(monkeypatch, crash_at, after_insert)
+    transformer = BrowsingTransformer(db_path, defer_initialization=True)
+    with pytest.raises(RuntimeError, match="simulated crash"):
+        transformer.write(transformer.transform(data), resume_key="digest")
+    # Only the batches before the crash are committed
+    assert len(read_entries(db_path)) == (crash_at - 1) * 100
+    monkeypatch.undo()
+
+    transformer = BrowsingTransformer(db_path, defer_initialization=True)
+    transformer.write(transformer.transform(data), resume_key="digest")
+
+    entries = read_entries(db_path)
+    assert [entry_id for entry_id, _ in entries] == list(range(1, ENTRIES + 1))
+    assert [time_spent for _, time_spent in entries] == [i % 100 for i in range(ENTRIES)]
+    assert not has_progress_table(db_path)
+
+
+def test_resume_with_different_batch_size(tmp_path, monkeypatch, small_batches):
+    db_path = str(tmp_path / "db.libsql")
+    data = browsing_input()
+
+    crash_on_batch(monkeypatch, 5, after_insert=True)
+    transformer = BrowsingTransformer(db_path, defer_initialization=True)
+    with pytest.raises(RuntimeError):
+        transformer.write(transformer.transform(data), resume_key="digest")
+    monkeypatch.undo()
+
+    # e.g. a memory budget picks other batch and chunk sizes on the second run
+    monkeypatch.setattr(base_transformer, "WRITE_BATCH_SIZE", 333)
+    monkeypatch.setattr(browsing_transformer, "WRITE_BATCH_SIZE", 250)
+    transformer = BrowsingTransformer(db_path, defer_initialization=True)
+    transformer.write(transformer.transform(data), resume_key="digest")
+
+    assert [entry_id for entry_id, _ in read_entries(db_path)] == list(range(1, ENTRIES + 1))
+
+
+def test_other_input_is_not_resumed(tmp_path, monkeypatch, small_batches):
+    db_path = str(tmp_path / "db.libsql")
+
+    crash_on_batch(monkeypatch, 3, after_insert=False)
+    transformer = BrowsingTransformer(db_path, defer_initialization=True)
+    with pytest.raises(RuntimeError):
+        transformer.write(transformer.transform(browsing_input()), resume_key="digest")
+    monkeypatch.undo()
+
+    transformer = BrowsingTransformer(db_path, defer_initialization=True)
+    transformer.write(transformer.transform(browsing_input(150)), resume_key="other-digest")
+
+    assert [entry_id for entry_id, _ in read_entries(db_path)] == list(range(1, 151))
+
+
+def test_columnar_export_includes_resumed_rows(tmp_path, monkeypatch, small_batches):
+    pq = pytest.importorskip("pyarrow.parquet")
+    db_path = str(tmp_path / "db.libsql")
+    data = browsing_input()
+
+    crash_on_batch(monkeypatch, 4, after_insert=True)
+    transformer = BrowsingTransformer(db_path, columnar_format="parquet", defer_initialization=True)
+    with pytest.raises(RuntimeError):
+        transformer.write(transformer.transform(data), resume_key="digest")
+    # Nothing is published for a failed write
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["db.libsql"]
+    monkeypatch.undo()
+
+    transformer = BrowsingTransformer(db_path, columnar_format="parquet", defer_initialization=True)
+    transformer.write(transformer.transform(data), resume_key="digest")
+
+    table = pq.read_table(tmp_path / "browsing_entries.parquet")
+    assert table.column("entry_id").to_pylist() == list(range(1, ENTRIES + 1))
+    assert table.column("url").to_pylist() == [f"https://www.cnn.com/p{i % 7}" for i in range(ENTRIES)]